@@ -1,8 +1,13 @@
 import requests
-import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from xml.sax.saxutils import escape, quoteattr
+from lxml import etree
 from google import genai
 from dotenv import load_dotenv
+import io
+import multiprocessing
 import os
+import threading
 import re
 import json
 import pandas as pd
@@ -10,6 +15,115 @@ import pandas as pd
 load_dotenv()
 gemini_api_key = os.getenv("GEMINI_API_KEY")
 
+TEI_NS = "http://www.tei-c.org/ns/1.0"
+TEI_SECTIONS = {
+  f"{{{TEI_NS}}}teiHeader": "head",
+  f"{{{TEI_NS}}}body": "body",
+  f"{{{TEI_NS}}}listBibl": "tail",
+}
+TEI_NSMAP = {"tei": TEI_NS}
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+GROBID_WORKERS = 4
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def _get_parse_pool():
+  # One shared pool; forkserver avoids forking the multithreaded API server.
+  global _parse_pool
+  with _parse_pool_lock:
+    if _parse_pool is None:
+      _parse_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("forkserver"))
+    return _parse_pool
+
+def _free(elem):
+  # Drop the element and every already processed sibling so the tree never grows past one branch.
+  elem.clear(keep_tail=True)
+  parent = elem.getparent()
+  if parent is not None:
+    while elem.getprevious() is not None:
+      del parent[0]
+
+def _declarations(elem):
+  return [f" xmlns:{prefix}={quoteattr(uri)}" if prefix else f" xmlns={quoteattr(uri)}"
+          for prefix, uri in elem.nsmap.items()]
+
+def _start_tag(elem):
+  # Opening tag of a section root, declaring every namespace in scope once.
+  prefixes = {uri: prefix for prefix, uri in elem.nsmap.items()}
+  attrs = _declarations(elem)
+  for key, value in elem.attrib.items():
+    qname = etree.QName(key)
+    if qname.namespace == XML_NS:
+      key = f"xml:{qname.localname}"
+    elif qname.namespace:
+      key = f"{prefixes[qname.namespace]}:{qname.localname}"
+    attrs.append(f" {key}={quoteattr(value)}")
+  return f"<{etree.QName(elem).localname}{''.join(attrs)}>"
+
+def _serialize_child(elem, declarations):
+  # The namespaces are declared on the section root, so drop lxml's per-child copies.
+  start, sep, rest = etree.tostring(elem, encoding="unicode", with_tail=False).partition(">")
+  for declaration in declarations:
+    start = start.replace(declaration, "", 1)
+  return start + sep + rest
+
+def _bibl_record(elem):
+  # Works for both a listBibl biblStruct and the header fileDesc.
+  # Journal and series titles (level j/s) name the venue, not the work, so they
+  # are never used; a reference without its own title is dropped by the graph.
+  title = elem.find(".//tei:title[@level='a']", TEI_NSMAP)
+  if title is None:
+    title = elem.find(".//tei:title[@level='m']", TEI_NSMAP)
+  doi = elem.find(".//tei:idno[@type='DOI']", TEI_NSMAP)
+  date = elem.find(".//tei:date[@when]", TEI_NSMAP)
+  return {
+    "doi": (doi.text or "").strip() if doi is not None else "",
+    "title": " ".join("".join(title.itertext()).split()) if title is not None else "",
+    "year": date.get("when")[:4] if date is not None else "",
+  }
+
+def parse_tei(xml):
+  """
+  Streams GROBID TEI once and returns the (header, body, references) XML strings,
+  the paper's own {doi, title, year} record and the same record for each reference.
+  Only the direct children of those sections are serialized, and every element
+  is freed as soon as it has been handled.
+  """
+  if isinstance(xml, str):
+    xml = xml.encode("utf-8")
+  parts = {name: None for name in TEI_SECTIONS.values()}
+  current, children, declarations = None, [], []
+  record, references = {"doi": "", "title": "", "year": ""}, []
+  for event, elem in etree.iterparse(io.BytesIO(xml), events=("start", "end")):
+    if event == "start":
+      if current is None and elem.tag in TEI_SECTIONS and parts[TEI_SECTIONS[elem.tag]] is None:
+        current, children = elem, []
+        declarations = _declarations(elem)
+      continue
+    if elem is current:
+      # Tails are only complete once the next sibling (or the section) has been read.
+      for shell in list(elem):
+        children.append(escape(shell.tail or ""))
+      name = etree.QName(elem).localname
+      parts[TEI_SECTIONS[elem.tag]] = f'{_start_tag(elem)}{escape(elem.text or "")}{"".join(children)}</{name}>'
+      current = None
+      _free(elem)
+    elif current is None:
+      _free(elem)
+    elif elem.getparent() is current:
+      while elem.getprevious() is not None:
+        children.append(escape(elem.getprevious().tail or ""))
+        del current[0]
+      if elem.tag == f"{{{TEI_NS}}}fileDesc":
+        record = _bibl_record(elem)
+      elif elem.tag == f"{{{TEI_NS}}}biblStruct" and current.tag == f"{{{TEI_NS}}}listBibl":
+        references.append(_bibl_record(elem))
+      children.append(_serialize_child(elem, declarations))
+      elem.clear(keep_tail=True)
+  head, body, tail = (parts[name] or "" for name in ("head", "body", "tail"))
+  return head, body, tail, record, references
+
 class Prompts:
   def __init__(self):
     pass
@@ -113,6 +227,8 @@ class Paper:
     self.head = ""
     self.body = ""
     self.tail = ""
+    self.record = None
+    self.references = []
     self._meta_data = None
     self._summary = None
     self._agent = Agent(api_key=gemini_api_key)
@@ -129,16 +245,24 @@ class Paper:
   def parse_grobid_output(self):
     if not self.xml_meta_data:
       self.processFulltextDocument()
-    ns = {"tei": "http://www.tei-c.org/ns/1.0"}
-    root = ET.fromstring(self.xml_meta_data)
-    metadata_elem = root.find(".//tei:teiHeader", ns)
-    body_elem = root.find(".//tei:body", ns)
-    refs_elem = root.find(".//tei:listBibl", ns)
-    self.head = ET.tostring(metadata_elem, encoding="unicode") if metadata_elem is not None else ""
-    self.body = ET.tostring(body_elem, encoding="unicode") if body_elem is not None else ""
-    self.tail = ET.tostring(refs_elem, encoding="unicode") if refs_elem is not None else ""
+    self.head, self.body, self.tail, self.record, self.references = parse_tei(self.xml_meta_data)
     return self.head, self.body, self.tail
 
+  @staticmethod
+  def parse_many(papers):
+    """
+    Parses the GROBID output of several papers in a shared process pool so XML
+    work runs on every core. Papers without TEI yet are sent to GROBID concurrently first.
+    """
+    pending = [paper for paper in papers if not paper.xml_meta_data]
+    if pending:
+      with ThreadPoolExecutor(max_workers=GROBID_WORKERS) as pool:
+        list(pool.map(Paper.processFulltextDocument, pending))
+    results = _get_parse_pool().map(parse_tei, [paper.xml_meta_data for paper in papers])
+    for paper, result in zip(papers, results):
+      paper.head, paper.body, paper.tail, paper.record, paper.references = result
+    return papers
+
   def get_meta_data(self):
     if self._meta_data is None:
       if not self.head and not self.body and not self.tail:
@@ -0,0 +1,336 @@
+from collections import defaultdict
+import numpy as np
+import threading
+import json
+import os
+import re
+
+DOI_PATTERN = re.compile(r"10\.\d{4,9}/[^\s\"<>]+", re.IGNORECASE)
+DOI_PLACEHOLDER = re.compile(r"n{4,}|x{4,}", re.IGNORECASE)
+# Pending edges are merged into the CSR arrays once there are this many.
+COMPACT_THRESHOLD = 100_000
+ARRAYS = ("out_indptr", "out_indices", "in_indptr", "in_indices")
+
+def normalize_doi(doi: str):
+  """
+  Returns the lowercase bare DOI, or None if there is none. GROBID copies the
+  DOI line of a paper's template verbatim, so "10.1145/nnnnnnn..." style
+  stand-ins are treated as missing rather than merging unrelated papers.
+  """
+  match = DOI_PATTERN.search(doi or "")
+  if not match:
+    return None
+  doi = match.group(0).rstrip(".,;").lower()
+  return None if DOI_PLACEHOLDER.search(doi) else doi
+
+def normalize_title(title: str):
+  return " ".join(re.findall(r"[a-z0-9]+", (title or "").lower()))
+
+def has_key(record: dict):
+  """
+  Returns True if a {doi, title, year} record has a DOI or title to be looked up by.
+  """
+  return bool(normalize_doi(record.get("doi")) or normalize_title(record.get("title")))
+
+def _csr(src, dst, num_nodes):
+  order = np.lexsort((dst, src))
+  src, dst = src[order], dst[order]
+  # An edge can be both in the arrays and pending if a save was interrupted,
+  # so repeated (src, dst) pairs, adjacent after sorting, are dropped.
+  keep = np.ones(len(src), dtype=bool)
+  keep[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+  src, dst = src[keep], dst[keep]
+  indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+  np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+  return indptr, dst.astype(np.int32)
+
+class CitationGraph:
+  """
+  A local citation graph stored as forward (citing -> cited) and reverse CSR
+  arrays on disk. New edges are buffered and merged into the arrays in bulk,
+  so ingesting a paper never rewrites the whole graph.
+
+  Papers are matched by normalized DOI, then by normalized title with the
+  year used to pick between papers sharing a title.
+
+  Layout of the graph directory:
+    nodes.jsonl: one [doi, title, year] record per node, appended as nodes are
+      added, plus {"node", "record"} lines for later sightings of a node that
+      carried new fields (e.g. a DOI the first sighting lacked).
+    pending.npy: buffered (citing, cited) edges not yet merged into the arrays.
+    out_indptr.npy, out_indices.npy, in_indptr.npy, in_indices.npy: the CSR arrays.
+  """
+  def __init__(self, path: str = "citations"):
+    """
+    Loads the graph from path, creating an empty one if it does not exist.
+
+    Args:
+      path: Directory the graph is persisted to.
+    """
+    self.path = path
+    self._lock = threading.Lock()
+    self.nodes = []
+    # normalized DOI -> node, normalized title -> nodes with that title
+    self.dois = {}
+    self.titles = defaultdict(list)
+    self._saved_nodes = 0
+    self._aliases = []
+    # Bumped by every compaction; the arrays are written when it differs from the saved one.
+    self._version = 0
+    self._saved_version = 0
+    # Serializes compaction and saving, which run without holding _lock.
+    self._write_lock = threading.Lock()
+    os.makedirs(path, exist_ok=True)
+    nodes_path = os.path.join(path, "nodes.jsonl")
+    if os.path.exists(nodes_path):
+      with open(nodes_path) as f:
+        for line in f:
+          entry = json.loads(line)
+          if isinstance(entry, dict):
+            self._merge(entry["node"], entry["record"])
+          else:
+            self._register(entry)
+      self._saved_nodes = len(self.nodes)
+    if os.path.exists(os.path.join(path, "out_indptr.npy")):
+      # Memory-mapped so startup cost does not grow with the number of edges.
+      arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS]
+    else:
+      empty_indptr, empty_indices = np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32)
+      arrays = [empty_indptr, empty_indices, empty_indptr, empty_indices]
+    # Swapped as whole tuples so a reader never pairs new offsets with old indices.
+    self._out = (arrays[0], arrays[1])
+    self._in = (arrays[2], arrays[3])
+    self._out_pending = defaultdict(set)
+    self._in_pending = defaultdict(set)
+    self._pending = []
+    pending_path = os.path.join(path, "pending.npy")
+    if os.path.exists(pending_path):
+      for citing, cited in np.load(pending_path).tolist():
+        if cited not in self._row(self._out, citing):
+          self._add_edge(citing, cited)
+
+  def _index(self, node, record):
+    learned = False
+    doi = normalize_doi(record[0])
+    if doi and doi not in self.dois:
+      self.dois[doi] = node
+      learned = True
+    title = normalize_title(record[1])
+    if title and node not in self.titles[title]:
+      self.titles[title].append(node)
+      learned = True
+    return learned
+
+  def _register(self, record):
+    node = len(self.nodes)
+    self.nodes.append(list(record))
+    self._index(node, record)
+    return node
+
+  def _merge(self, node, record):
+    # Later sightings may carry keys or fields the first one lacked.
+    learned = self._index(node, record)
+    stored = self.nodes[node]
+    if normalize_doi(record[0]) and not normalize_doi(stored[0]):
+      stored[0] = record[0]
+      learned = True
+    for i in (1, 2):
+      if record[i] and not stored[i]:
+        stored[i] = record[i]
+        learned = True
+    return learned
+
+  def _lookup(self, doi, title, year):
+    doi = normalize_doi(doi)
+    if doi and doi in self.dois:
+      return self.dois[doi]
+    candidates = [
+      node for node in self.titles.get(normalize_title(title), [])
+      # A different DOI means a different paper that happens to share the title.
+      if not doi or normalize_doi(self.nodes[node][0]) in (None, doi)
+    ]
+    if not candidates:
+      return None
+    for node in candidates:
+      if year and self.nodes[node][2] == year:
+        return node
+    return candidates[0]
+
+  def lookup(self, doi: str = "", title: str = "", year: str = ""):
+    """
+    Returns the node id of a paper, or None if it is not in the graph.
+    """
+    with self._lock:
+      return self._lookup(doi, title, year)
+
+  def _node(self, record: dict):
+    fields = [record.get("doi") or "", record.get("title") or "", record.get("year") or ""]
+    node = self._lookup(*fields)
+    if node is None:
+      return self._register(fields)
+    if self._merge(node, fields):
+      self._aliases.append({"node": node, "record": fields})
+    return node
+
+  def _add_edge(self, citing, cited):
+    if cited in self._out_pending[citing]:
+      return
+    self._out_pending[citing].add(cited)
+    self._in_pending[cited].add(citing)
+    self._pending.append((citing, cited))
+
+  def add_paper(self, paper: dict, references: list):
+    """
+    Adds a paper and the references it cites to the graph.
+
+    Args:
+      paper: The paper's own record with doi, title and year fields.
+      references: Reference records with doi, title and year fields, as
+        produced by parse_tei from the GROBID listBibl.
+
+    Returns:
+      The node id of the paper, or None if the paper has no usable key.
+    """
+    if not has_key(paper):
+      return None
+    with self._lock:
+      citing = self._node(paper)
+      known = set(self._row(self._out, citing).tolist())
+      for reference in references:
+        if not has_key(reference):
+          continue
+        cited = self._node(reference)
+        if cited != citing and cited not in known:
+          self._add_edge(citing, cited)
+      should_compact = len(self._pending) >= COMPACT_THRESHOLD
+    if should_compact:
+      self.compact()
+    return citing
+
+  def compact(self):
+    """
+    Merges the pending edges into the CSR arrays. The arrays are rebuilt
+    without holding the read lock, so lookups keep being answered meanwhile.
+    """
+    with self._write_lock:
+      with self._lock:
+        num_nodes = len(self.nodes)
+        out_indptr, out_indices = self._out
+        pending = list(self._pending)
+      pending = np.array(pending, dtype=np.int64).reshape(-1, 2)
+      src = np.repeat(np.arange(len(out_indptr) - 1, dtype=np.int64), np.diff(out_indptr))
+      src = np.concatenate([src, pending[:, 0]])
+      dst = np.concatenate([np.asarray(out_indices, dtype=np.int64), pending[:, 1]])
+      out_csr, in_csr = _csr(src, dst, num_nodes), _csr(dst, src, num_nodes)
+      with self._lock:
+        self._out, self._in = out_csr, in_csr
+        # Edges added while the arrays were rebuilt stay pending.
+        added = self._pending[len(pending):]
+        self._out_pending = defaultdict(set)
+        self._in_pending = defaultdict(set)
+        self._pending = []
+        for citing, cited in added:
+          self._add_edge(citing, cited)
+        self._version += 1
+
+  def save(self):
+    """
+    Appends new nodes and aliases and writes the pending edges, plus the CSR
+    arrays if they changed. The files are written without holding the read lock.
+    """
+    with self._write_lock:
+      with self._lock:
+        nodes_end, aliases_end = len(self.nodes), len(self._aliases)
+        # Aliases go after the nodes so every alias refers to a node already on disk.
+        entries = self.nodes[self._saved_nodes:nodes_end] + self._aliases[:aliases_end]
+        version, arrays = self._version, dict(zip(ARRAYS, self._out + self._in))
+        pending = list(self._pending)
+      pending = np.array(pending, dtype=np.int64).reshape(-1, 2)
+      with open(os.path.join(self.path, "nodes.jsonl"), "a") as f:
+        for entry in entries:
+          f.write(json.dumps(entry) + "\n")
+      if version != self._saved_version:
+        for name in ARRAYS:
+          tmp_path = os.path.join(self.path, f"{name}.tmp.npy")
+          np.save(tmp_path, arrays[name])
+          os.replace(tmp_path, os.path.join(self.path, f"{name}.npy"))
+      tmp_path = os.path.join(self.path, "pending.tmp.npy")
+      np.save(tmp_path, pending)
+      os.replace(tmp_path, os.path.join(self.path, "pending.npy"))
+      with self._lock:
+        self._saved_nodes = nodes_end
+        del self._aliases[:aliases_end]
+        self._saved_version = version
+
+  def _row(self, csr, node):
+    indptr, indices = csr
+    if node >= len(indptr) - 1:
+      return indices[:0]
+    return indices[indptr[node]:indptr[node + 1]]
+
+  def _cites(self, node):
+    row = self._row(self._out, node)
+    pending = self._out_pending.get(node)
+    return np.concatenate([row, np.fromiter(pending, dtype=np.int32)]) if pending else np.asarray(row)
+
+  def _citers(self, node):
+    row = self._row(self._in, node)
+    pending = self._in_pending.get(node)
+    return np.concatenate([row, np.fromiter(pending, dtype=np.int32)]) if pending else np.asarray(row)
+
+  def _records(self, nodes, counts=None):
+    output = []
+    for i, node in enumerate(nodes):
+      doi, title, year = self.nodes[node]
+      record = {"doi": doi, "title": title, "year": year}
+      if counts is not None:
+        record["count"] = int(counts[i])
+      output.append(record)
+    return output
+
+  def _ranked(self, neighbours, exclude, top_n):
+    if not neighbours:
+      return []
+    nodes, counts = np.unique(np.concatenate(neighbours), return_counts=True)
+    keep = nodes != exclude
+    nodes, counts = nodes[keep], counts[keep]
+    order = np.argsort(-counts, kind="stable")[:top_n]
+    return self._records(nodes[order].tolist(), counts[order])
+
+  def citers(self, doi: str = "", title: str = "", year: str = ""):
+    """
+    Returns the papers that cite the given paper.
+    """
+    with self._lock:
+      node = self._lookup(doi, title, year)
+      return [] if node is None else self._records(self._citers(node).tolist())
+
+  def references(self, doi: str = "", title: str = "", year: str = ""):
+    """
+    Returns the papers the given paper cites.
+    """
+    with self._lock:
+      node = self._lookup(doi, title, year)
+      return [] if node is None else self._records(self._cites(node).tolist())
+
+  def co_citation(self, doi: str = "", title: str = "", year: str = "", top_n: int = 10):
+    """
+    Returns the papers most often cited together with the given paper,
+    with the number of citing papers they share.
+    """
+    with self._lock:
+      node = self._lookup(doi, title, year)
+      if node is None:
+        return []
+      return self._ranked([self._cites(citer) for citer in self._citers(node).tolist()], node, top_n)
+
+  def bibliographic_coupling(self, doi: str = "", title: str = "", year: str = "", top_n: int = 10):
+    """
+    Returns the papers sharing the most references with the given paper,
+    with the number of shared references.
+    """
+    with self._lock:
+      node = self._lookup(doi, title, year)
+      if node is None:
+        return []
+      return self._ranked([self._citers(cited) for cited in self._cites(node).tolist()], node, top_n)
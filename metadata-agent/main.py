@@ -1,14 +1,18 @@
 from fastapi import FastAPI, UploadFile, File,Form
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import logging
 import tempfile
-from typing import Dict
+from typing import Dict, List
 import shutil
 import os
 import pandas as pd
 from Agents import Paper  # assume your code is in paper_parser.py
 from datasets import Dataset
 from Formula import formula
+from citations import CitationGraph
 app = FastAPI()
 
 key = os.getenv('GEMINI_API_KEY')
@@ -20,8 +24,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+citation_graph = CitationGraph(os.getenv("CITATION_GRAPH_PATH", "citations"))
+
+logger = logging.getLogger(__name__)
+
+def index_citations(paper):
+    # Indexing is a side effect, so a failure here must not fail the extraction.
+    try:
+        if paper.record and citation_graph.add_paper(paper.record, paper.references) is not None:
+            citation_graph.save()
+    except Exception:
+        logger.exception("Failed to add %s to the citation graph", paper.pdf_path)
+
 @app.post("/paper/metadata")
 async def extract_metadata(file: UploadFile = File(...)):
+    tmp_path = None
     try:
         # Save uploaded file to a temp location
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
@@ -29,31 +46,83 @@ async def extract_metadata(file: UploadFile = File(...)):
             tmp_path = tmp.name
 
         paper = Paper(pdf_path=tmp_path)
-        metadata = paper.get_meta_data()
-
-        os.remove(tmp_path)
+        metadata = await run_in_threadpool(paper.get_meta_data)
+        await run_in_threadpool(index_citations, paper)
         return JSONResponse(content=metadata)
 
     except Exception as e:
         return {"error": str(e)}
 
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+@app.post("/paper/metadata/batch")
+async def extract_metadata_batch(files: List[UploadFile] = File(...)):
+    tmp_paths = []
+    try:
+        for file in files:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+                tmp.write(await file.read())
+                tmp_paths.append(tmp.name)
+
+        papers = [Paper(pdf_path=tmp_path) for tmp_path in tmp_paths]
+        # GROBID calls run concurrently and TEI parsing runs in a process pool.
+        await run_in_threadpool(Paper.parse_many, papers)
+        metadata = await asyncio.gather(*(run_in_threadpool(paper.get_meta_data) for paper in papers))
+        for paper in papers:
+            await run_in_threadpool(index_citations, paper)
+        return JSONResponse(content=list(metadata))
+
+    except Exception as e:
+        return {"error": str(e)}
+
+    finally:
+        for tmp_path in tmp_paths:
+            os.remove(tmp_path)
+
 
 @app.post("/paper/summary")
 async def extract_summary(file: UploadFile = File(...)):
+    tmp_path = None
     try:
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
             tmp.write(await file.read())
             tmp_path = tmp.name
 
         paper = Paper(pdf_path=tmp_path)
-        summary = paper.get_summary()
-
-        os.remove(tmp_path)
+        summary = await run_in_threadpool(paper.get_summary)
+        await run_in_threadpool(index_citations, paper)
         return JSONResponse(content=summary)
 
     except Exception as e:
         return {"error": str(e)}
 
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+@app.post("/citations/citers")
+async def get_citers(doi: str = Form(""), title: str = Form(""), year: str = Form("")):
+    return JSONResponse(content=await run_in_threadpool(citation_graph.citers, doi, title, year))
+
+
+@app.post("/citations/references")
+async def get_references(doi: str = Form(""), title: str = Form(""), year: str = Form("")):
+    return JSONResponse(content=await run_in_threadpool(citation_graph.references, doi, title, year))
+
+
+@app.post("/citations/co-citation")
+async def get_co_citation(doi: str = Form(""), title: str = Form(""), year: str = Form(""), top_n: int = Form(10)):
+    return JSONResponse(content=await run_in_threadpool(citation_graph.co_citation, doi, title, year, top_n))
+
+
+@app.post("/citations/coupling")
+async def get_bibliographic_coupling(doi: str = Form(""), title: str = Form(""), year: str = Form(""), top_n: int = Form(10)):
+    return JSONResponse(content=await run_in_threadpool(citation_graph.bibliographic_coupling, doi, title, year, top_n))
+
 
 ds = Dataset()
 
@@ -1,22 +1,62 @@
 from pinecone import Pinecone, ServerlessSpec
 from typing import Literal
+from dedup import DuplicateIndex
+import glob
 import json
+import os
 import time
+
+# Chunking is bounded in whitespace tokens; llama-text-embed-v2 and the
+# bge reranker both truncate long inputs, so chunks stay well under their limits.
+CHUNK_TOKENS = 256
+CHUNK_OVERLAP = 32
+# Maximum number of records per upsert_records call for integrated indexes.
+UPSERT_BATCH_SIZE = 96
+# How many chunk candidates to fetch per requested parent when aggregating.
+CHUNK_FANOUT = 3
+# Upper bound on candidates per search; bge-reranker-v2-m3 reranks at most 100 documents.
+MAX_CANDIDATES = 100
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP):
+  """
+  Splits text into overlapping chunks of at most max_tokens whitespace tokens.
+
+  Args:
+    text: The text to split.
+    max_tokens: The maximum number of tokens per chunk.
+    overlap: The number of tokens shared between consecutive chunks.
+  """
+  if overlap >= max_tokens:
+    raise ValueError("overlap must be smaller than max_tokens")
+  tokens = text.split()
+  if len(tokens) <= max_tokens:
+    return [" ".join(tokens)] if tokens else []
+  chunks = []
+  step = max_tokens - overlap
+  for start in range(0, len(tokens), step):
+    chunks.append(" ".join(tokens[start:start + max_tokens]))
+    if start + max_tokens >= len(tokens):
+      break
+  return chunks
+
 class VectorDatabase:
   """
   A class to interact with a Pinecone vector database, specifically designed
   for serverless indexes with automatic embedding generation.
   """
-  def __init__(self, pinecone_api_key: str, index_name: str):
+  def __init__(self, pinecone_api_key: str, index_name: str, dedup_dir: str = "dedup"):
     """
     Initializes the Pinecone client and sets up the index.
     
     Args:
       pinecone_api_key: Your API key for Pinecone.
       index_name: The name of the index to use or create.
+      dedup_dir: Directory where the per-namespace duplicate indexes are stored.
     """
     self.pc = Pinecone(api_key=pinecone_api_key)
     self.index_name = index_name
+    self.dedup_dir = dedup_dir
+    self.duplicates = {}
     self.index = self._setup()
 
   def _setup(self):
@@ -37,7 +77,20 @@ class VectorDatabase:
     time.sleep(10)
     return idx
 
-  def insert(self, id: str, summary: str, title: str, namespace: Literal["paper", "dataset", "algo"]):
+  def _duplicate_index(self, namespace: str):
+    if namespace not in self.duplicates:
+      os.makedirs(self.dedup_dir, exist_ok=True)
+      path = os.path.join(self.dedup_dir, f"{self.index_name}-{namespace}.pkl")
+      self.duplicates[namespace] = DuplicateIndex(path=path)
+    return self.duplicates[namespace]
+
+  def _delete_document(self, id: str, namespace: str):
+    self.index.delete(ids=[id], namespace=namespace)
+    for chunk_ids in self.index.list(prefix=f"{id}#", namespace=namespace):
+      self.index.delete(ids=chunk_ids, namespace=namespace)
+
+  def insert(self, id: str, summary: str, title: str, namespace: Literal["paper", "dataset", "algo"], chunked: bool = False,
+             doi: str = "", eprint: str = "", on_duplicate: Literal["skip", "merge", "link"] = "link"):
     """
     Inserts a record into the index. The text is embedded automatically by Pinecone.
     
@@ -46,36 +99,117 @@ class VectorDatabase:
       summary: The text content to be embedded and stored.
       title: The title of the document.
       namespace: The namespace to insert the record into.
+      chunked: If True, the text is split into overlapping chunks stored as
+        "<id>#<n>" records that point back to id through parent_id.
+      doi: The DOI from generate_meta_data, used as an exact duplicate key.
+      eprint: The eprint (e.g. arXiv id) from generate_meta_data, used as an exact duplicate key.
+      on_duplicate: What to do when the document duplicates one already stored:
+        "skip" leaves the index untouched, "merge" replaces the stored copy under
+        its id, and "link" stores this copy as a version of the stored one.
+        Re-inserting an id that is already stored always updates it in place.
+
+    Returns:
+      A dict with the id the text was stored under, the canonical id it duplicates
+      (None if it is new) and the action taken.
     """
-    records = [{
-      "id": id,
-      "chunk_text": summary,
-      "title": title
-    }]
-    temp = self.index.describe_index_stats()
-    self.index.upsert_records(namespace,records)
-    print(f"Successfully inserted record with id: {id} into namespace: {namespace}")
+    if not summary.strip():
+      raise ValueError("summary must not be empty")
+    duplicates = self._duplicate_index(namespace)
+    signature = duplicates.signature(summary)
+    if id in duplicates.canonical:
+      # Re-inserting a known id updates it in place and keeps its version link.
+      duplicate_of = duplicates.canonical[id] if duplicates.canonical[id] != id else None
+      on_duplicate = "update"
+    else:
+      duplicate_of = duplicates.find(summary, doi=doi, eprint=eprint, signature=signature)
+    if duplicate_of and on_duplicate == "skip":
+      print(f"Skipped record with id: {id}, duplicate of: {duplicate_of}")
+      return {"id": duplicate_of, "duplicate_of": duplicate_of, "action": "skip"}
+    if duplicate_of and on_duplicate == "merge":
+      id = duplicate_of
+    canonical_id = duplicate_of or id
+    # Drop earlier records under this id, chunked or not, so none are left orphaned.
+    self._delete_document(id, namespace)
+
+    if chunked:
+      records = [{
+        "id": f"{id}#{i}",
+        "chunk_text": chunk,
+        "title": title,
+        "parent_id": id,
+        "canonical_id": canonical_id,
+        "chunk_index": i
+      } for i, chunk in enumerate(chunk_text(summary))]
+    else:
+      records = [{
+        "id": id,
+        "chunk_text": summary,
+        "title": title,
+        "parent_id": id,
+        "canonical_id": canonical_id
+      }]
+    for start in range(0, len(records), UPSERT_BATCH_SIZE):
+      self.index.upsert_records(namespace, records[start:start + UPSERT_BATCH_SIZE])
+    duplicates.add(id, summary, doi=doi, eprint=eprint, canonical_id=canonical_id, signature=signature)
+    print(f"Successfully inserted {len(records)} record(s) with id: {id} into namespace: {namespace}")
+    action = on_duplicate if duplicate_of or on_duplicate == "update" else "insert"
+    return {"id": id, "duplicate_of": duplicate_of, "action": action}
+
+  def retrieve(self , k:int , query: str, namespace: Literal["paper","dataset","algo"], aggregate: bool = False,
+               collapse_duplicates: bool = False):
+    """
+    Searches the index and reranks the hits.
 
-  def retrieve(self , k:int , query: str, namespace: Literal["paper","dataset","algo"]):
-    reranked_results = self.index.search(
-      namespace=namespace,
-      query={
-        "top_k": k,
-        "inputs": {"text": query}
-      },
-      rerank={
-        "model": "bge-reranker-v2-m3",
-        "top_n": k,
-        "rank_fields": ["chunk_text"]
-      }   
-    )
-    output = []
-    for hit in reranked_results['result']['hits']:
-      output.append({
-        "id": hit["_id"],
-        "score": round(hit['_score'], 2),
-        "text": hit['fields']['chunk_text']
-      })
+    Args:
+      k: The number of results to return.
+      query: The query text.
+      namespace: The namespace to search.
+      aggregate: If True, chunk hits are grouped by parent_id and each parent
+        is scored by its best chunk, so k counts documents instead of chunks.
+        The search is repeated with more candidates until k documents are
+        found, up to MAX_CANDIDATES chunks, so fewer than k can come back when
+        a few long documents own all of them.
+      collapse_duplicates: If True, hits are grouped by canonical_id so linked
+        versions of the same document take a single result slot.
+    """
+    grouped = aggregate or collapse_duplicates
+    candidates = min(k * CHUNK_FANOUT, MAX_CANDIDATES) if grouped else k
+    while True:
+      reranked_results = self.index.search(
+        namespace=namespace,
+        query={
+          "top_k": candidates,
+          "inputs": {"text": query}
+        },
+        rerank={
+          "model": "bge-reranker-v2-m3",
+          "top_n": candidates,
+          "rank_fields": ["chunk_text"]
+        }
+      )
+      hits = reranked_results['result']['hits']
+      output = []
+      seen = set()
+      for hit in hits:
+        hit_id = hit["_id"]
+        if grouped:
+          hit_id = hit['fields'].get('parent_id', hit_id)
+          # Hits arrive sorted by rerank score, so the first hit of a group is its best one.
+          group = hit['fields'].get('canonical_id', hit_id) if collapse_duplicates else hit_id
+          if group in seen:
+            continue
+          seen.add(group)
+        output.append({
+          "id": hit_id,
+          "score": round(hit['_score'], 2),
+          "text": hit['fields']['chunk_text']
+        })
+        if len(output) == k:
+          break
+      # Stop once k documents are found, the namespace is exhausted or the cap is reached.
+      if not grouped or len(output) == k or len(hits) < candidates or candidates >= MAX_CANDIDATES:
+        break
+      candidates = min(candidates * 2, MAX_CANDIDATES)
     return json.dumps(output, indent=2)
 
   def clear_all(self):
@@ -84,4 +218,7 @@ class VectorDatabase:
     """
     print(f"Deleting index '{self.index_name}' entirely...")
     self.pc.delete_index(self.index_name)
+    for path in glob.glob(os.path.join(self.dedup_dir, f"{self.index_name}-*.pkl*")):
+      os.remove(path)
+    self.duplicates = {}
     print("Index deleted successfully.")
\ No newline at end of file
@@ -0,0 +1,176 @@
+from datasketch import LeanMinHash, MinHash, MinHashLSH
+import os
+import pickle
+import re
+
+DOI_PATTERN = re.compile(r"10\.\d{4,9}/[^\s\"<>]+", re.IGNORECASE)
+# ACM/IEEE templates ship placeholder DOIs such as "10.1145/nnnnnnn.nnnnnnn".
+DOI_PLACEHOLDER = re.compile(r"n{4,}|x{4,}", re.IGNORECASE)
+ARXIV_DOI_PATTERN = re.compile(r"^10\.48550/arxiv\.(.+)$")
+# New style ids (2308.10462v3) and old style ids (hep-th/9901001v1).
+ARXIV_PATTERN = re.compile(r"(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7})(?:v\d+)?", re.IGNORECASE)
+# Inserts are appended to a log and folded into a full snapshot this often.
+SNAPSHOT_EVERY = 500
+# Pinned so hash values persisted by one datasketch version stay comparable in another.
+MINHASH_SCHEME = "affine32"
+
+def normalize_doi(doi: str):
+  """
+  Returns the lowercase bare DOI, or None if doi is empty or a template placeholder.
+  """
+  match = DOI_PATTERN.search(doi or "")
+  if not match:
+    return None
+  value = match.group(0).rstrip(".,;").lower()
+  if DOI_PLACEHOLDER.search(value):
+    return None
+  return value
+
+def normalize_eprint(eprint: str):
+  """
+  Returns the version-less arXiv id, e.g. "arXiv:2308.10462v3[cs.SE]" -> "2308.10462".
+  """
+  match = ARXIV_PATTERN.search(eprint or "")
+  return match.group(1).lower() if match else None
+
+def identity_keys(doi: str = "", eprint: str = ""):
+  """
+  Builds the exact-match keys for a document from its DOI and eprint fields.
+  """
+  keys = []
+  doi_key = normalize_doi(doi)
+  if doi_key:
+    keys.append(f"doi:{doi_key}")
+    # arXiv DOIs identify the same paper as the bare eprint id.
+    arxiv_doi = ARXIV_DOI_PATTERN.match(doi_key)
+    if arxiv_doi:
+      eprint = eprint or arxiv_doi.group(1)
+  eprint_key = normalize_eprint(eprint)
+  if eprint_key:
+    keys.append(f"arxiv:{eprint_key}")
+  return keys
+
+class DuplicateIndex:
+  """
+  A local MinHash/LSH index used to detect near-duplicate documents before
+  they are embedded and upserted. Exact DOI/eprint keys are checked first,
+  then word shingles are compared through LSH.
+  """
+  def __init__(self, path: str = None, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 5):
+    """
+    Loads the index from path if it exists, otherwise starts an empty one.
+
+    Args:
+      path: Snapshot file the index is persisted to; inserts since the last
+        snapshot are appended to "<path>.log". None keeps it in memory only.
+      threshold: Estimated Jaccard similarity above which documents are duplicates.
+      num_perm: Number of MinHash permutations.
+      shingle_size: Number of words per shingle.
+    """
+    self.path = path
+    self.num_perm = num_perm
+    self.shingle_size = shingle_size
+    # The LSH is rebuilt from the stored signatures, so threshold always applies.
+    self.lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+    # document id -> MinHash hash values, identity key -> document id,
+    # document id -> canonical document id
+    self.signatures = {}
+    self.keys = {}
+    self.canonical = {}
+    self._logged = 0
+    if path and os.path.exists(path):
+      with open(path, "rb") as f:
+        state = pickle.load(f)
+      if state["num_perm"] != num_perm:
+        raise ValueError(f"{path} was built with num_perm={state['num_perm']}, not {num_perm}")
+      self.keys = state["keys"]
+      self.canonical = state["canonical"]
+      for id, hashvalues in state["signatures"].items():
+        self._insert_signature(id, hashvalues)
+    if path and os.path.exists(self.log_path):
+      with open(self.log_path, "rb") as f:
+        while True:
+          try:
+            self._apply(*pickle.load(f))
+          except (EOFError, pickle.UnpicklingError):
+            # A torn final entry from an interrupted write is dropped.
+            break
+          self._logged += 1
+
+  @property
+  def log_path(self):
+    return self.path + ".log"
+
+  def signature(self, text: str):
+    """
+    Returns the MinHash of the text's word shingles, or None if the text is
+    shorter than one shingle and too short to compare reliably.
+    """
+    tokens = re.findall(r"\w+", text.lower())
+    if len(tokens) < self.shingle_size:
+      return None
+    size = self.shingle_size
+    shingles = {" ".join(tokens[i:i + size]).encode("utf8") for i in range(len(tokens) - size + 1)}
+    minhash = MinHash(num_perm=self.num_perm, scheme=MINHASH_SCHEME)
+    minhash.update_batch(shingles)
+    return minhash
+
+  def find(self, text: str, doi: str = "", eprint: str = "", signature: MinHash = None):
+    """
+    Returns the canonical id of an existing duplicate of the document, or None.
+    """
+    for key in identity_keys(doi, eprint):
+      if key in self.keys:
+        return self.canonical[self.keys[key]]
+    if signature is None:
+      signature = self.signature(text)
+    if signature is None:
+      return None
+    matches = self.lsh.query(signature)
+    if matches:
+      return self.canonical[min(matches)]
+    return None
+
+  def _insert_signature(self, id, hashvalues):
+    self.lsh.insert(id, LeanMinHash(seed=1, hashvalues=hashvalues, scheme=MINHASH_SCHEME), check_duplication=False)
+    self.signatures[id] = hashvalues
+
+  def _apply(self, id, hashvalues, keys, canonical_id):
+    if id in self.signatures:
+      self.lsh.remove(id)
+      del self.signatures[id]
+    if hashvalues is not None:
+      self._insert_signature(id, hashvalues)
+    for key in keys:
+      self.keys.setdefault(key, id)
+    self.canonical[id] = canonical_id
+
+  def add(self, id: str, text: str, doi: str = "", eprint: str = "", canonical_id: str = None, signature: MinHash = None):
+    """
+    Registers a document. canonical_id marks it as a version of an earlier document.
+    """
+    if signature is None:
+      signature = self.signature(text)
+    entry = (id, signature.hashvalues if signature is not None else None, identity_keys(doi, eprint), canonical_id or id)
+    self._apply(*entry)
+    if not self.path:
+      return
+    with open(self.log_path, "ab") as f:
+      pickle.dump(entry, f)
+    self._logged += 1
+    if self._logged >= SNAPSHOT_EVERY:
+      self.save()
+
+  def save(self):
+    """
+    Writes a snapshot of the index and truncates the insert log.
+    """
+    if not self.path:
+      return
+    tmp_path = self.path + ".tmp"
+    with open(tmp_path, "wb") as f:
+      pickle.dump({"num_perm": self.num_perm, "signatures": self.signatures, "keys": self.keys, "canonical": self.canonical}, f)
+    os.replace(tmp_path, self.path)
+    if os.path.exists(self.log_path):
+      os.remove(self.log_path)
+    self._logged = 0
@@ -49,11 +49,20 @@ async def insert_vector(
     id: str,
     summary: str,
     title: str,
-    namespace: Literal["paper", "dataset", "algo"]
+    namespace: Literal["paper", "dataset", "algo"],
+    chunked: bool = False,
+    doi: str = "",
+    eprint: str = "",
+    on_duplicate: Literal["skip", "merge", "link"] = "link"
 ):
     try:
-        db.insert(id=id, summary=summary, title=title, namespace=namespace)
-        return {"status": "success", "message": f"Vector with id '{id}' inserted successfully."}
+        result = db.insert(id=id, summary=summary, title=title, namespace=namespace, chunked=chunked,
+                           doi=doi, eprint=eprint, on_duplicate=on_duplicate)
+        if result["action"] == "skip":
+            return {"status": "skipped", "message": f"Vector with id '{id}' duplicates '{result['duplicate_of']}'.", **result}
+        return {"status": "success", "message": f"Vector with id '{result['id']}' inserted successfully.", **result}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -62,10 +71,13 @@ async def insert_vector(
 async def retrieve_vector(
     top_k: int,
     query: str,
-    namespace: Literal["paper", "dataset", "algo"]
+    namespace: Literal["paper", "dataset", "algo"],
+    aggregate: bool = False,
+    collapse_duplicates: bool = False
 ):
     try:
-        results = db.retrieve(k=top_k, query=query, namespace=namespace)
+        results = db.retrieve(k=top_k, query=query, namespace=namespace, aggregate=aggregate,
+                              collapse_duplicates=collapse_duplicates)
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))